@@ -4,10 +4,11 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
 from typing import Optional
-from sqlmodel import Session, select
+from sqlmodel import Session
 
+from cache import CacheBackend, USER_CACHE_TTL, get_cache
 from database import get_session
-from models import User
+from models import User, UserPublic
 
 # Password Hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -35,7 +36,16 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)):
+def user_cache_key(user_id: int):
+    return f"user:{user_id}"
+
+def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    session: Session = Depends(get_session),
+    cache: CacheBackend = Depends(get_cache),
+):
+    # Returns a UserPublic (id, username), not a session-bound User row: use
+    # current_user.id to query carts/orders rather than lazy relationships.
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -44,11 +54,19 @@ def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Dep
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        if username is None:
+        user_id: int = payload.get("uid")
+        if username is None or user_id is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = session.exec(select(User).where(User.username == username)).first()
-    if user is None:
+
+    def load_user():
+        user = session.get(User, user_id)
+        # Only the public fields are cached, never the password hash
+        return UserPublic.model_validate(user).model_dump() if user else None
+
+    user_data = cache.get_or_set(user_cache_key(user_id), load_user, ttl=USER_CACHE_TTL)
+    # The id may now belong to a different user than the one the token was issued to
+    if user_data is None or user_data["username"] != username:
         raise credentials_exception
-    return user
+    return UserPublic.model_validate(user_data)
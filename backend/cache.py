@@ -0,0 +1,495 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+try:
+    import redis
+except ImportError:  # only needed when CACHE_URL points at a Redis server
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Cache backend used for Product rows and resolved User principals.
+# Set CACHE_URL to a redis:// (or unix://) URL so all uvicorn/gunicorn workers
+# share one cache; leave it unset to keep a per-process cache.
+CACHE_URL = os.environ.get("CACHE_URL")
+# Seconds to wait on the Redis server before treating a call as a cache miss
+CACHE_SOCKET_TIMEOUT = float(os.environ.get("CACHE_SOCKET_TIMEOUT", "0.5"))
+CACHE_CONNECT_TIMEOUT = float(os.environ.get("CACHE_CONNECT_TIMEOUT", "0.5"))
+# Upper bound on entries held in process (the in-memory backend and each
+# worker's local copy in front of Redis); least recently used go first
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "10000"))
+CACHE_CHANNEL = "cache-invalidate"
+
+PRODUCT_CACHE_TTL = 300
+USER_CACHE_TTL = 60
+
+REDIS_URL_SCHEMES = ("redis://", "rediss://", "unix://")
+
+# Deletes the single-flight lock only if it still holds our token
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Returned in place of a result when Redis could not be reached
+_UNAVAILABLE = object()
+
+
+class _Flight:
+    """A get_or_set load in progress that other threads can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.failed = False
+
+
+class CacheBackend(ABC):
+    """Interface shared by the in-process and Redis cache backends.
+
+    Values must be JSON-serialisable (e.g. ``model.model_dump()``) so that both
+    backends behave the same way. ``None`` is never cached.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        # Keys currently being loaded by get_or_set in this process
+        self._flights: Dict[str, _Flight] = {}
+        self._flights_lock = threading.Lock()
+
+    @abstractmethod
+    def _lookup(self, keys: List[str]) -> Dict[str, Any]:
+        """Return the cached values for ``keys`` without touching the stats."""
+
+    @abstractmethod
+    def set_many(self, items: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, *keys: str) -> None:
+        ...
+
+    @abstractmethod
+    def delete_prefix(self, prefix: str) -> None:
+        """Delete every key starting with ``prefix``."""
+
+    def clear(self) -> None:
+        self.delete_prefix("")
+
+    def close(self) -> None:
+        pass
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        found = self._lookup(keys)
+        self._record(len(found), len(keys) - len(found))
+        return found
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.set_many({key: value}, ttl)
+
+    def _record(self, hits: int, misses: int) -> None:
+        with self._stats_lock:
+            self.hits += hits
+            self.misses += misses
+
+    def _peek(self, key: str) -> Optional[Any]:
+        return self._lookup([key]).get(key)
+
+    def get_or_set(self, key: str, loader: Callable[[], Any], ttl: Optional[float] = None) -> Optional[Any]:
+        """Return the cached value for ``key``, calling ``loader`` on a miss.
+
+        Concurrent misses for the same key in this process share a single
+        ``loader`` call instead of all hitting the database. Other keys are
+        never blocked by it.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.failed:
+                return self.get_or_set(key, loader, ttl)
+            return flight.value
+        try:
+            flight.value = self._load(key, loader, ttl)
+            return flight.value
+        except BaseException:
+            flight.failed = True
+            raise
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _load(self, key: str, loader: Callable[[], Any], ttl: Optional[float]) -> Optional[Any]:
+        # Another thread may have filled the key since our miss
+        value = self._peek(key)
+        if value is not None:
+            return value
+        value = loader()
+        if value is not None:
+            self.set(key, value, ttl)
+        return value
+
+
+class InMemoryCache(CacheBackend):
+    """Per-process LRU cache. Each worker holds its own copy."""
+
+    def __init__(self, default_ttl: Optional[float] = None, max_entries: int = CACHE_MAX_ENTRIES):
+        super().__init__()
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _lookup(self, keys: List[str]) -> Dict[str, Any]:
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is None:
+                    continue
+                value, expires_at = entry
+                if expires_at is not None and expires_at <= now:
+                    del self._data[key]
+                    continue
+                self._data.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set_many(self, items: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        ttl = ttl if ttl is not None else self.default_ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            for key, value in items.items():
+                if value is not None:
+                    self._data[key] = (value, expires_at)
+                    self._data.move_to_end(key)
+            # Expired entries are never read again, so they age out here too
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._lock:
+            if not prefix:
+                self._data.clear()
+                return
+            for key in [key for key in self._data if key.startswith(prefix)]:
+                del self._data[key]
+
+
+class RedisCache(CacheBackend):
+    """Cache shared by all workers through a Redis-protocol server.
+
+    Each worker also keeps a short-lived local copy of hot keys. ``set_many``,
+    ``delete`` and ``delete_prefix`` publish the affected keys on ``channel``
+    and every other worker evicts them from its local copy. A local copy can
+    therefore lag a write by the pub/sub delivery delay, and by at most
+    ``local_ttl`` if the message is lost (e.g. while Redis is unreachable).
+
+    Redis errors are logged and treated as cache misses, so an outage falls
+    back to the database instead of failing requests. After an error Redis is
+    bypassed for ``retry_interval`` seconds rather than retried on every call.
+
+    ``client`` can be any redis-py compatible client, which lets tests pass a
+    local stand-in (e.g. ``fakeredis.FakeRedis``) instead of a real server.
+    Create one instance per worker process (see ``init_cache``): the pub/sub
+    listener thread does not survive a fork.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        client: Any = None,
+        prefix: str = "cache:",
+        channel: str = CACHE_CHANNEL,
+        default_ttl: Optional[float] = None,
+        local_ttl: Optional[float] = 5,
+        local_max_entries: int = CACHE_MAX_ENTRIES,
+        lock_timeout: float = 10.0,
+        poll_interval: float = 0.05,
+        retry_interval: float = 1.0,
+        socket_timeout: float = CACHE_SOCKET_TIMEOUT,
+        socket_connect_timeout: float = CACHE_CONNECT_TIMEOUT,
+    ):
+        super().__init__()
+        if redis is None:
+            raise RuntimeError("RedisCache requires the 'redis' package (pip install redis)")
+        if client is None:
+            client = redis.Redis.from_url(
+                url, socket_timeout=socket_timeout, socket_connect_timeout=socket_connect_timeout
+            )
+        self.client = client
+        self.prefix = prefix
+        self.channel = channel
+        self.default_ttl = default_ttl
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.local = InMemoryCache(default_ttl=local_ttl, max_entries=local_max_entries) if local_ttl else None
+        self._id = uuid.uuid4().hex
+        self._retry_at = 0.0
+        # Bumped on every local write/eviction; see _fill_local
+        self._generation = 0
+        self._local_lock = threading.Lock()
+        self._release_lock_script = self.client.register_script(RELEASE_LOCK_SCRIPT)
+
+        self._pubsub = None
+        self._listener = None
+        if self.local is not None:
+            try:
+                self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                self._pubsub.subscribe(**{self.channel: self._on_invalidate})
+                self._listener = self._pubsub.run_in_thread(
+                    sleep_time=0.1, daemon=True, exception_handler=self._on_listener_error
+                )
+            except redis.RedisError:
+                # Without invalidation messages the local copy could go stale
+                logger.exception("Cache invalidation listener unavailable, disabling local cache")
+                self.local = None
+                self._pubsub = None
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def _run(self, action: str, func: Callable[[], Any], default: Any = None) -> Any:
+        """Call Redis, returning ``default`` if it fails or is being bypassed."""
+        if time.monotonic() < self._retry_at:
+            return default
+        try:
+            return func()
+        except redis.RedisError as exc:
+            logger.warning("Cache %s failed, bypassing Redis for %ss: %s", action, self.retry_interval, exc)
+            self._retry_at = time.monotonic() + self.retry_interval
+            return default
+
+    # --- Local copy ---
+
+    def _fill_local(self, items: Dict[str, Any], generation: int) -> None:
+        # Values read from Redis are only kept if nothing was written or
+        # invalidated locally since the read started
+        if self.local is None or not items:
+            return
+        with self._local_lock:
+            if self._generation == generation:
+                self.local.set_many(items)
+
+    def _write_local(self, items: Dict[str, Any]) -> None:
+        if self.local is None:
+            return
+        with self._local_lock:
+            self._generation += 1
+            self.local.set_many(items)
+
+    def _evict_local(self, keys: Optional[List[str]] = None, prefix: Optional[str] = None) -> None:
+        if self.local is None:
+            return
+        with self._local_lock:
+            self._generation += 1
+            if prefix is not None:
+                self.local.delete_prefix(prefix)
+            else:
+                self.local.delete(*keys)
+
+    def _publish(self, keys: Optional[List[str]] = None, prefix: Optional[str] = None) -> None:
+        message = json.dumps({"origin": self._id, "keys": keys, "prefix": prefix})
+        self._run("publish", lambda: self.client.publish(self.channel, message))
+
+    def _on_invalidate(self, message: dict) -> None:
+        data = json.loads(message["data"])
+        if data["origin"] == self._id:
+            return
+        self._evict_local(data["keys"], data["prefix"])
+
+    def _on_listener_error(self, exc: Exception, pubsub: Any, thread: Any) -> None:
+        # Invalidations may have been missed while disconnected
+        logger.warning("Cache invalidation listener error: %s", exc)
+        self._evict_local(prefix="")
+        time.sleep(1)
+
+    # --- Backend interface ---
+
+    def _lookup(self, keys: List[str]) -> Dict[str, Any]:
+        found: Dict[str, Any] = {}
+        if self.local is not None:
+            found = self.local._lookup(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            generation = self._generation
+            # One MGET round trip for everything not held locally
+            raw_values = self._run("read", lambda: self.client.mget([self._key(key) for key in missing]))
+            if raw_values is None:
+                return found
+            fetched = {key: json.loads(raw) for key, raw in zip(missing, raw_values) if raw is not None}
+            self._fill_local(fetched, generation)
+            found.update(fetched)
+        return found
+
+    def set_many(self, items: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        items = {key: value for key, value in items.items() if value is not None}
+        if not items:
+            return
+        ttl = ttl if ttl is not None else self.default_ttl
+
+        def write():
+            pipe = self.client.pipeline()
+            for key, value in items.items():
+                pipe.set(self._key(key), json.dumps(value), px=int(ttl * 1000) if ttl else None)
+            return pipe.execute()
+
+        if self._run("write", write) is None:
+            # Redis may or may not hold the new values; don't trust the old ones
+            self._evict_local(list(items))
+            return
+        self._write_local(items)
+        self._publish(keys=list(items))
+
+    def delete(self, *keys: str) -> None:
+        if not keys:
+            return
+        # Delete in Redis first so a concurrent read can't refill the local copy
+        self._run("delete", lambda: self.client.delete(*[self._key(key) for key in keys]))
+        self._evict_local(list(keys))
+        self._publish(keys=list(keys))
+
+    def delete_prefix(self, prefix: str) -> None:
+        def delete_matching():
+            keys = list(self.client.scan_iter(match=self._key(prefix) + "*", count=500))
+            if keys:
+                self.client.delete(*keys)
+
+        self._run("delete", delete_matching)
+        self._evict_local(prefix=prefix)
+        self._publish(prefix=prefix)
+
+    # --- Single-flight across workers ---
+
+    def _load(self, key: str, loader: Callable[[], Any], ttl: Optional[float]) -> Optional[Any]:
+        """Load ``key`` under a short-lived Redis lock shared by all workers.
+
+        The worker that wins the lock runs ``loader``; the others poll for its
+        result instead of recomputing. If the lock holder does not finish
+        within ``lock_timeout`` the caller loads the value itself, and if Redis
+        is unreachable it loads straight away.
+        """
+        value = self._peek(key)
+        if value is not None:
+            return value
+
+        lock_key = self._key("lock:" + key)
+        token = self._acquire_lock(lock_key)
+        if token is None:
+            value = self._wait_for(key, lock_key)
+            if value is not None:
+                return value
+        try:
+            value = loader()
+            if value is not None:
+                self.set(key, value, ttl)
+            return value
+        finally:
+            if token is not None and token is not _UNAVAILABLE:
+                self._release_lock(lock_key, token)
+
+    def _acquire_lock(self, lock_key: str) -> Any:
+        """Return our token if we got the lock, ``None`` if another worker
+        holds it, or ``_UNAVAILABLE`` if Redis could not be reached."""
+        token = uuid.uuid4().hex
+        acquired = self._run(
+            "lock",
+            lambda: self.client.set(lock_key, token, nx=True, px=int(self.lock_timeout * 1000)),
+            _UNAVAILABLE,
+        )
+        if acquired is _UNAVAILABLE:
+            return _UNAVAILABLE
+        return token if acquired else None
+
+    def _wait_for(self, key: str, lock_key: str) -> Optional[Any]:
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            value = self._peek(key)
+            if value is not None:
+                return value
+            # The holder finished without caching anything (e.g. no such row),
+            # or Redis went away
+            if not self._run("lock", lambda: self.client.exists(lock_key), 0):
+                return None
+        return None
+
+    def _release_lock(self, lock_key: str, token: str) -> None:
+        self._run("unlock", lambda: self._release_lock_script(keys=[lock_key], args=[token]))
+
+    def close(self) -> None:
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+        if self._pubsub is not None:
+            self._pubsub.close()
+            self._pubsub = None
+
+
+def create_cache(url: Optional[str] = None) -> CacheBackend:
+    if not url:
+        return InMemoryCache(default_ttl=PRODUCT_CACHE_TTL)
+    if url.startswith(REDIS_URL_SCHEMES):
+        return RedisCache(url=url, default_ttl=PRODUCT_CACHE_TTL)
+    # Don't echo the URL back, it may contain a password
+    scheme = url.split("://", 1)[0]
+    raise ValueError(f"Unsupported CACHE_URL scheme {scheme!r}, expected one of {', '.join(REDIS_URL_SCHEMES)}")
+
+
+_cache: Optional[CacheBackend] = None
+_cache_lock = threading.Lock()
+
+# Called from the app lifespan so each worker process gets its own backend
+def init_cache(url: Optional[str] = CACHE_URL) -> CacheBackend:
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+        _cache = create_cache(url)
+        return _cache
+
+def close_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+            _cache = None
+
+# Dependency to get the cache backend, overridable in tests like get_session
+def get_cache():
+    with _cache_lock:
+        if _cache is not None:
+            return _cache
+    return init_cache()
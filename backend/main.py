@@ -7,7 +7,8 @@ from datetime import timedelta
 
 # Import from our new files
 from database import get_session, create_db_and_tables, engine
-from auth import get_password_hash, verify_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, get_current_user
+from cache import CacheBackend, PRODUCT_CACHE_TTL, get_cache, init_cache, close_cache
+from auth import get_password_hash, verify_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, get_current_user, user_cache_key
 from models import User, UserCreate, UserPublic, Token, Product, Cart, CartItem, Order, OrderItem, CartItemPublic, CartPublic, OrderItemPublic, OrderPublic
 
 # --- Pydantic Models for API input/output ---
@@ -33,8 +34,15 @@ async def lifespan(app: FastAPI):
                 product = Product.model_validate(prod_data)
                 session.add(product)
             session.commit()
+    # Created here rather than at import so every worker process gets its own
+    # backend (and pub/sub listener), even when gunicorn preloads the app
+    cache = init_cache()
+    # Drop product rows and listings cached from an earlier database or seed
+    cache.delete("products:ids")
+    cache.delete_prefix("product:")
     yield
     print("Lifespan shutdown.")
+    close_cache()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -49,7 +57,11 @@ app.add_middleware(
 # --- API Endpoints ---
 
 @app.post("/api/register", response_model=UserPublic)
-def register_user(user_create: UserCreate, session: Session = Depends(get_session)):
+def register_user(
+    user_create: UserCreate,
+    session: Session = Depends(get_session),
+    cache: CacheBackend = Depends(get_cache),
+):
     db_user = session.exec(select(User).where(User.username == user_create.username)).first()
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
@@ -60,6 +72,7 @@ def register_user(user_create: UserCreate, session: Session = Depends(get_sessio
     session.add(new_user)
     session.commit()
     session.refresh(new_user)
+    cache.delete(user_cache_key(new_user.id))
     
     return new_user
 
@@ -74,12 +87,12 @@ def login_for_access_token(form_data: UserCreate, session: Session = Depends(get
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": user.username, "uid": user.id}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/api/users/me", response_model=UserPublic)
-def read_users_me(current_user: User = Depends(get_current_user)):
+def read_users_me(current_user: UserPublic = Depends(get_current_user)):
     return current_user
 
 # --- Cart Endpoints ---
@@ -91,8 +104,9 @@ class CartItemAdd(SQLModel):
 @app.post("/api/cart/items", response_model=CartItemPublic)
 def add_item_to_cart(
     item_add: CartItemAdd,
-    current_user: User = Depends(get_current_user),
+    current_user: UserPublic = Depends(get_current_user),
     session: Session = Depends(get_session),
+    cache: CacheBackend = Depends(get_cache),
 ):
     cart = session.exec(select(Cart).where(Cart.user_id == current_user.id)).first()
     if not cart:
@@ -101,7 +115,7 @@ def add_item_to_cart(
         session.commit()
         session.refresh(cart)
 
-    product = session.exec(select(Product).where(Product.id == item_add.product_id)).first()
+    product = get_cached_product(item_add.product_id, session, cache)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
@@ -123,7 +137,7 @@ def add_item_to_cart(
 
 @app.get("/api/cart", response_model=CartPublic)
 def get_user_cart(
-    current_user: User = Depends(get_current_user),
+    current_user: UserPublic = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
     cart = session.exec(select(Cart).where(Cart.user_id == current_user.id)).first()
@@ -134,7 +148,7 @@ def get_user_cart(
 @app.delete("/api/cart/items/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
 def remove_item_from_cart(
     item_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: UserPublic = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
     cart = session.exec(select(Cart).where(Cart.user_id == current_user.id)).first()
@@ -167,7 +181,7 @@ class CartItemUpdate(SQLModel):
 def update_cart_item_quantity(
     item_id: int,
     item_update: CartItemUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: UserPublic = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
     cart = session.exec(select(Cart).where(Cart.user_id == current_user.id)).first()
@@ -189,10 +203,42 @@ def update_cart_item_quantity(
     session.refresh(cart_item)
     return cart_item
 
+# --- Product Endpoints ---
+
+def product_cache_key(product_id: int):
+    return f"product:{product_id}"
+
+def get_cached_product(product_id: int, session: Session, cache: CacheBackend) -> Optional[Product]:
+    def load_product():
+        product = session.exec(select(Product).where(Product.id == product_id)).first()
+        return product.model_dump() if product else None
+
+    product_data = cache.get_or_set(product_cache_key(product_id), load_product, ttl=PRODUCT_CACHE_TTL)
+    return Product.model_validate(product_data) if product_data else None
+
 @app.get("/api/products", response_model=List[Product])
-def get_products(session: Session = Depends(get_session)):
-    products = session.exec(select(Product)).all()
-    return products
+def get_products(session: Session = Depends(get_session), cache: CacheBackend = Depends(get_cache)):
+    def load_product_ids():
+        return list(session.exec(select(Product.id)).all())
+
+    product_ids = cache.get_or_set("products:ids", load_product_ids, ttl=PRODUCT_CACHE_TTL)
+    if not product_ids:
+        return []
+
+    # Fetch all product rows in one round trip, then load whatever is missing in one query
+    cached = cache.get_many(product_cache_key(product_id) for product_id in product_ids)
+    missing_ids = [product_id for product_id in product_ids if product_cache_key(product_id) not in cached]
+    if missing_ids:
+        loaded = session.exec(select(Product).where(Product.id.in_(missing_ids))).all()
+        fresh = {product_cache_key(product.id): product.model_dump() for product in loaded}
+        cache.set_many(fresh, ttl=PRODUCT_CACHE_TTL)
+        cached.update(fresh)
+
+    return [
+        Product.model_validate(cached[product_cache_key(product_id)])
+        for product_id in product_ids
+        if product_cache_key(product_id) in cached
+    ]
 
 @app.get("/")
 def read_root():
@@ -202,7 +248,7 @@ def read_root():
 
 @app.post("/api/orders", response_model=OrderPublic)
 def create_order_from_cart(
-    current_user: User = Depends(get_current_user),
+    current_user: UserPublic = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
     cart = session.exec(select(Cart).where(Cart.user_id == current_user.id)).first()
@@ -237,7 +283,7 @@ def create_order_from_cart(
 
 @app.get("/api/orders", response_model=List[OrderPublic])
 def get_user_orders(
-    current_user: User = Depends(get_current_user),
+    current_user: UserPublic = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
     orders = session.exec(select(Order).where(Order.user_id == current_user.id)).all()
@@ -246,7 +292,7 @@ def get_user_orders(
 @app.get("/api/orders/{order_id}", response_model=OrderPublic)
 def get_single_order(
     order_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: UserPublic = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
     order = session.exec(
@@ -1,6 +1,7 @@
 from fastapi.testclient import TestClient
 from sqlmodel import Session, SQLModel, create_engine
 from main import app, get_session
+from cache import InMemoryCache, get_cache
 import pytest
 
 DATABASE_URL = "sqlite:///test.db"
@@ -13,6 +14,16 @@ def get_test_session():
 
 app.dependency_overrides[get_session] = get_test_session
 
+# Fresh cache per test: test.db is dropped after every test
+test_cache = InMemoryCache()
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    test_cache.clear()
+    app.dependency_overrides[get_cache] = lambda: test_cache
+    yield
+    test_cache.clear()
+
 @pytest.fixture(scope="function")
 def client():
     SQLModel.metadata.create_all(engine)
@@ -64,3 +75,44 @@ def test_access_protected_route_with_invalid_token(client):
     headers = {"Authorization": "Bearer invalidtoken"}
     response = client.get("/api/users/me", headers=headers)
     assert response.status_code == 401
+
+def test_current_user_is_cached_without_password_hash(client):
+    client.post("/api/register", json={"username": "testuser", "password": "testpassword"})
+    login_response = client.post("/api/login", json={"username": "testuser", "password": "testpassword"})
+    headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+    client.get("/api/users/me", headers=headers)
+    hits = test_cache.hits
+    response = client.get("/api/users/me", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["username"] == "testuser"
+    assert test_cache.hits == hits + 1
+    assert test_cache.get("user:1") == {"id": 1, "username": "testuser"}
+
+def test_register_invalidates_cached_principal(client):
+    test_cache.set("user:1", {"id": 1, "username": "ghost"})
+    client.post("/api/register", json={"username": "testuser", "password": "testpassword"})
+    assert test_cache.get("user:1") is None
+
+def test_token_rejected_after_user_id_is_reused(client):
+    client.post("/api/register", json={"username": "alice", "password": "testpassword"})
+    login_response = client.post("/api/login", json={"username": "alice", "password": "testpassword"})
+    alice_headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+    assert client.get("/api/users/me", headers=alice_headers).status_code == 200
+
+    # Reset the database so the next user gets alice's id
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    response = client.post("/api/register", json={"username": "bob", "password": "testpassword"})
+    assert response.json()["id"] == 1
+
+    response = client.get("/api/users/me", headers=alice_headers)
+    assert response.status_code == 401
+
+def test_token_rejected_when_cached_principal_is_stale(client):
+    client.post("/api/register", json={"username": "alice", "password": "testpassword"})
+    login_response = client.post("/api/login", json={"username": "alice", "password": "testpassword"})
+    alice_headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+    # Another worker cached a different owner for the same id
+    test_cache.set("user:1", {"id": 1, "username": "bob"})
+    response = client.get("/api/users/me", headers=alice_headers)
+    assert response.status_code == 401
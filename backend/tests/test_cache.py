@@ -0,0 +1,292 @@
+import threading
+import time
+import fakeredis
+import pytest
+
+from cache import CacheBackend, InMemoryCache, RedisCache, create_cache
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+def run_concurrently(funcs):
+    results = []
+    threads = [threading.Thread(target=lambda func=func: results.append(func())) for func in funcs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def slow_loader(calls, value):
+    def load():
+        calls.append(1)
+        time.sleep(0.1)
+        return value
+    return load
+
+# --- In-process cache ---
+
+def test_backend_must_implement_interface():
+    class IncompleteCache(CacheBackend):
+        def _lookup(self, keys):
+            return {}
+
+    with pytest.raises(TypeError):
+        IncompleteCache()
+
+def test_in_memory_get_set_delete():
+    cache = InMemoryCache()
+    cache.set("product:1", {"id": 1, "name": "Sneakers"})
+    assert cache.get("product:1") == {"id": 1, "name": "Sneakers"}
+    cache.delete("product:1")
+    assert cache.get("product:1") is None
+
+def test_in_memory_ttl_expires():
+    cache = InMemoryCache()
+    cache.set("product:1", {"id": 1}, ttl=0.05)
+    time.sleep(0.1)
+    assert cache.get("product:1") is None
+
+def test_in_memory_get_many_returns_only_hits():
+    cache = InMemoryCache()
+    cache.set_many({"product:1": {"id": 1}, "product:2": {"id": 2}})
+    assert cache.get_many(["product:1", "product:2", "product:3"]) == {
+        "product:1": {"id": 1},
+        "product:2": {"id": 2},
+    }
+    assert cache.hits == 2
+    assert cache.misses == 1
+
+def test_in_memory_get_or_set_is_single_flight():
+    cache = InMemoryCache()
+    calls = []
+    load = slow_loader(calls, {"id": 1})
+    results = run_concurrently([lambda: cache.get_or_set("product:1", load)] * 8)
+    assert len(calls) == 1
+    assert results == [{"id": 1}] * 8
+
+def test_get_or_set_does_not_cache_none():
+    cache = InMemoryCache()
+    assert cache.get_or_set("user:ghost", lambda: None) is None
+    assert cache.get_or_set("user:ghost", lambda: {"id": 1}) == {"id": 1}
+
+def test_stats_are_exact_under_concurrency():
+    cache = InMemoryCache()
+    cache.set("product:1", {"id": 1})
+
+    def read():
+        for _ in range(2000):
+            cache.get("product:1")
+            cache._peek("product:1")
+
+    run_concurrently([read] * 8)
+    assert cache.hits == 16000
+    assert cache.misses == 0
+
+def test_single_flight_state_is_released_after_loads():
+    cache = InMemoryCache()
+    for product_id in range(1000):
+        cache.get_or_set(f"product:{product_id}", lambda: {"id": 1})
+    assert cache._flights == {}
+
+def test_single_flight_does_not_block_other_keys():
+    cache = InMemoryCache()
+    calls = []
+    thread = threading.Thread(target=lambda: cache.get_or_set("product:1", slow_loader(calls, {"id": 1})))
+    thread.start()
+    wait_for(lambda: calls)
+    started = time.monotonic()
+    assert cache.get_or_set("product:2", lambda: {"id": 2}) == {"id": 2}
+    assert time.monotonic() - started < 0.05
+    thread.join()
+
+def test_single_flight_shares_none_result():
+    cache = InMemoryCache()
+    calls = []
+    load = slow_loader(calls, None)
+    results = run_concurrently([lambda: cache.get_or_set("user:99", load)] * 8)
+    assert len(calls) == 1
+    assert results == [None] * 8
+
+def test_single_flight_retries_after_loader_error():
+    cache = InMemoryCache()
+
+    def failing_load():
+        raise RuntimeError("database down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_set("product:1", failing_load)
+    assert cache.get_or_set("product:1", lambda: {"id": 1}) == {"id": 1}
+
+def test_in_memory_is_bounded_with_lru_eviction():
+    cache = InMemoryCache(max_entries=3)
+    cache.set_many({"product:1": {"id": 1}, "product:2": {"id": 2}, "product:3": {"id": 3}})
+    cache.get("product:1")  # product:2 is now least recently used
+    cache.set("product:4", {"id": 4})
+    assert len(cache) == 3
+    assert cache.get("product:2") is None
+    assert cache.get("product:1") == {"id": 1}
+
+def test_in_memory_expired_entries_do_not_accumulate():
+    cache = InMemoryCache(max_entries=100)
+    for product_id in range(10000):
+        cache.set(f"product:{product_id}", {"id": product_id}, ttl=0.001)
+    assert len(cache) == 100
+
+def test_delete_prefix():
+    cache = InMemoryCache()
+    cache.set_many({"product:1": {"id": 1}, "product:2": {"id": 2}, "user:1": {"id": 1}})
+    cache.delete_prefix("product:")
+    assert cache.get_many(["product:1", "product:2", "user:1"]) == {"user:1": {"id": 1}}
+
+def test_create_cache_rejects_unknown_url_scheme():
+    assert isinstance(create_cache(None), InMemoryCache)
+    with pytest.raises(ValueError) as excinfo:
+        create_cache("redis+sentinel://:secret@localhost:26379")
+    assert "secret" not in str(excinfo.value)
+
+# --- Shared (Redis-protocol) cache, backed by a local stand-in server ---
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+@pytest.fixture
+def make_worker_cache(redis_server):
+    caches = []
+
+    def make(**kwargs):
+        # Each cache acts like a separate worker process sharing one server
+        cache = RedisCache(client=fakeredis.FakeRedis(server=redis_server), **kwargs)
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        cache.close()
+
+def test_redis_shares_values_between_workers(make_worker_cache):
+    worker_a = make_worker_cache()
+    worker_b = make_worker_cache()
+    worker_a.set("product:1", {"id": 1, "price": 20.0})
+    assert worker_b.get("product:1") == {"id": 1, "price": 20.0}
+
+def test_redis_get_many_batches_missing_keys(make_worker_cache):
+    worker_a = make_worker_cache(local_ttl=None)
+    worker_b = make_worker_cache(local_ttl=None)
+    worker_a.set_many({"product:1": {"id": 1}, "product:2": {"id": 2}})
+    assert worker_b.get_many(["product:1", "product:2", "product:3"]) == {
+        "product:1": {"id": 1},
+        "product:2": {"id": 2},
+    }
+
+def test_redis_delete_invalidates_other_workers(make_worker_cache):
+    worker_a = make_worker_cache()
+    worker_b = make_worker_cache()
+    worker_a.set("user:1", {"id": 1})
+    assert worker_b.get("user:1") == {"id": 1}  # now held in worker_b's local copy
+
+    worker_a.delete("user:1")
+    assert wait_for(lambda: worker_b.local.get("user:1") is None)
+    assert worker_b.get("user:1") is None
+
+def test_redis_set_invalidates_other_workers(make_worker_cache):
+    worker_a = make_worker_cache()
+    worker_b = make_worker_cache()
+    worker_a.set("product:1", {"id": 1, "price": 20.0})
+    assert worker_b.get("product:1") == {"id": 1, "price": 20.0}
+
+    worker_a.set("product:1", {"id": 1, "price": 25.0})
+    assert wait_for(lambda: worker_b.get("product:1") == {"id": 1, "price": 25.0})
+    assert worker_a.local.get("product:1") == {"id": 1, "price": 25.0}
+
+def test_redis_get_or_set_is_single_flight_across_workers(make_worker_cache):
+    workers = [make_worker_cache() for _ in range(4)]
+    calls = []
+    load = slow_loader(calls, {"id": 1})
+    results = run_concurrently([lambda worker=worker: worker.get_or_set("product:1", load) for worker in workers])
+    assert len(calls) == 1
+    assert results == [{"id": 1}] * 4
+
+def test_redis_get_or_set_waiters_stop_when_loader_finds_nothing(make_worker_cache):
+    workers = [make_worker_cache() for _ in range(4)]
+    calls = []
+    load = slow_loader(calls, None)
+    started = time.monotonic()
+    results = run_concurrently([lambda worker=worker: worker.get_or_set("user:99", load) for worker in workers])
+    assert results == [None] * 4
+    assert time.monotonic() - started < 2
+
+def test_redis_release_lock_keeps_lock_taken_by_another_worker(make_worker_cache):
+    cache = make_worker_cache(local_ttl=None)
+    cache.client.set("cache:lock:product:1", "other-worker")
+    cache._release_lock("cache:lock:product:1", "expired-token")
+    assert cache.client.get("cache:lock:product:1") == b"other-worker"
+
+def test_redis_delete_prefix_invalidates_other_workers(make_worker_cache):
+    worker_a = make_worker_cache()
+    worker_b = make_worker_cache()
+    worker_a.set_many({"product:1": {"id": 1}, "user:1": {"id": 1}})
+    assert worker_b.get("product:1") == {"id": 1}
+
+    worker_a.delete_prefix("product:")
+    assert wait_for(lambda: worker_b.local.get("product:1") is None)
+    assert worker_b.get("product:1") is None
+    assert worker_b.get("user:1") == {"id": 1}
+
+def test_redis_read_does_not_refill_local_copy_after_invalidation(make_worker_cache):
+    worker = make_worker_cache()
+    worker.client.set("cache:product:1", b'{"id": 1, "price": 20.0}')
+    mget = worker.client.mget
+
+    def mget_then_invalidate(keys):
+        values = mget(keys)
+        # Another worker overwrites the key while our read is in flight
+        worker._on_invalidate({"data": '{"origin": "other", "keys": ["product:1"], "prefix": null}'})
+        return values
+
+    worker.client.mget = mget_then_invalidate
+    assert worker.get("product:1") == {"id": 1, "price": 20.0}
+    assert worker.local.get("product:1") is None
+
+def test_redis_waiting_for_another_worker_does_not_block_other_keys(make_worker_cache):
+    worker = make_worker_cache(lock_timeout=1.0)
+    # Another worker is loading product:1
+    worker.client.set("cache:lock:product:1", "other-worker")
+    thread = threading.Thread(target=lambda: worker.get_or_set("product:1", lambda: {"id": 1}))
+    thread.start()
+    wait_for(lambda: "product:1" in worker._flights)
+    started = time.monotonic()
+    assert worker.get_or_set("product:2", lambda: {"id": 2}) == {"id": 2}
+    assert time.monotonic() - started < 0.2
+    thread.join()
+
+def test_redis_outage_falls_back_to_loader(redis_server, make_worker_cache):
+    cache = make_worker_cache(local_ttl=None, poll_interval=0.5)
+    redis_server.connected = False
+    assert cache.get("product:1") is None
+    started = time.monotonic()
+    assert cache.get_or_set("product:1", lambda: {"id": 1}) == {"id": 1}
+    assert time.monotonic() - started < 0.1
+    cache.set("product:1", {"id": 1})
+    cache.delete("product:1")
+
+def test_redis_is_retried_after_outage(redis_server, make_worker_cache):
+    cache = make_worker_cache(local_ttl=None, retry_interval=0.05)
+    redis_server.connected = False
+    cache.set("product:1", {"id": 1})
+    redis_server.connected = True
+    time.sleep(0.1)
+    cache.set("product:1", {"id": 1})
+    assert cache.get("product:1") == {"id": 1}
+
+def test_redis_client_from_url_has_bounded_timeouts():
+    cache = RedisCache(url="redis://localhost:6379/0", local_ttl=None, socket_timeout=0.25, socket_connect_timeout=0.1)
+    connection_kwargs = cache.client.connection_pool.connection_kwargs
+    assert connection_kwargs["socket_timeout"] == 0.25
+    assert connection_kwargs["socket_connect_timeout"] == 0.1
@@ -1,6 +1,7 @@
 from fastapi.testclient import TestClient
 from sqlmodel import Session, SQLModel, create_engine, select
 from main import app, get_session
+from cache import InMemoryCache, get_cache
 import pytest
 
 DATABASE_URL = "sqlite:///test.db"
@@ -13,6 +14,16 @@ def get_test_session():
 
 app.dependency_overrides[get_session] = get_test_session
 
+# Fresh cache per test: test.db is dropped after every test
+test_cache = InMemoryCache()
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    test_cache.clear()
+    app.dependency_overrides[get_cache] = lambda: test_cache
+    yield
+    test_cache.clear()
+
 @pytest.fixture(scope="function")
 def client():
     SQLModel.metadata.create_all(engine)
@@ -47,6 +58,34 @@ def test_product_id_fixture(client: TestClient, test_user_token: str):
     # For simplicity, let's assume product with ID 1 exists.
     return 1
 
+# --- Product Tests ---
+
+def test_get_products_is_cached(client: TestClient):
+    response = client.get("/api/products")
+    assert response.status_code == 200
+    assert [product["id"] for product in response.json()] == [1, 2, 3]
+    assert test_cache.get("products:ids") == [1, 2, 3]
+    assert test_cache.get("product:2")["name"] == "Denim Jeans"
+
+def test_get_products_merges_cached_and_missing_rows(client: TestClient):
+    client.get("/api/products")
+    # product:1 stays cached (with a marker name), product:2 must come from the DB
+    test_cache.set("product:1", {"id": 1, "name": "Cached T-Shirt", "price": 20.0, "imageUrl": None})
+    test_cache.delete("product:2")
+    response = client.get("/api/products")
+    assert response.status_code == 200
+    data = response.json()
+    assert [product["id"] for product in data] == [1, 2, 3]
+    assert data[0]["name"] == "Cached T-Shirt"
+    assert data[1]["name"] == "Denim Jeans"
+    assert test_cache.get("product:2")["name"] == "Denim Jeans"
+
+def test_add_unknown_product_to_cart(client: TestClient, test_user_token: str):
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+    response = client.post("/api/cart/items", json={"product_id": 999, "quantity": 1}, headers=headers)
+    assert response.status_code == 404
+    assert test_cache.get("product:999") is None
+
 # --- Cart Tests ---
 
 def test_add_item_to_cart(client: TestClient, test_user_token: str, test_product_id: int):